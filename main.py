@@ -1,11 +1,325 @@
 # Imports
 import streamlit as st
 import pandas as pd
+import numpy as np
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 from io import BytesIO
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import matplotlib.pyplot as plt
 import seaborn as sns
 
+try:
+    import python_calamine  # noqa: F401 - backs pandas' "calamine" engine
+    EXCEL_READ_ENGINE = "calamine"
+except ImportError:  # python-calamine is optional; pandas falls back to its default reader
+    EXCEL_READ_ENGINE = None
+
+try:
+    import xlsxwriter  # noqa: F401 - backs pandas' "xlsxwriter" engine
+    EXCEL_WRITE_ENGINE = "xlsxwriter"
+except ImportError:  # xlsxwriter is optional; pandas falls back to its default writer
+    EXCEL_WRITE_ENGINE = None
+
+try:
+    from numba import njit, prange
+except ImportError:  # numba is optional; pandas computes correlations without it
+    njit = None
+
+try:
+    import psutil
+except ImportError:  # psutil is optional; without it the memory budget is the fixed cap
+    psutil = None
+
+try:
+    import polars as pl
+    import polars.selectors as cs
+except ImportError:  # polars is optional; cleaning falls back to eager pandas
+    pl = None
+
+# Cleaning steps offered in the sidebar (for every file) and per file
+CLEANING_OPTIONS = ["Remove Duplicates", "Fill Missing Values", "Standardize Column Names", "Remove Columns"]
+
+# Bins used when summarizing a numeric X-axis for bar, line and histogram charts
+CHART_BINS = 100
+HISTOGRAM_BINS = 50
+
+# Most points handed to a scatter plot; larger frames are randomly sampled down to this
+MAX_PLOT_POINTS = 20_000
+
+# Largest correlation matrix that still gets a value printed in each cell
+MAX_ANNOTATED_CORR_COLUMNS = 20
+
+# Most uploads parsed at the same time
+MAX_LOAD_WORKERS = 8
+
+# Uploads larger than this are never parsed in full, whatever memory is free
+MAX_MEMORY_BUDGET = 2 * 1024**3
+
+# Rows per chunk when streaming large CSV files
+CSV_CHUNK_SIZE = 200_000
+
+# Allow xlsx exports past the 4 GB zip limit. constant_memory is not used because it only
+# accepts cells in row order, while pandas writes one column at a time and cells would be dropped.
+XLSX_WRITER_OPTIONS = {"options": {"use_zip64": True}}
+
+
+# Helper functions
+def memory_budget():
+    """Largest upload to parse in full: a quarter of the available memory, capped at MAX_MEMORY_BUDGET."""
+    if psutil is None:
+        return MAX_MEMORY_BUDGET
+    return min(psutil.virtual_memory().available // 4, MAX_MEMORY_BUDGET)
+
+
+def standardize_column_name(name):
+    """Lower-case a column name and replace spaces with underscores."""
+    return str(name).lower().replace(" ", "_")
+
+
+def dedupe_column_names(names):
+    """Rename repeated column names to name.1, name.2, ... the same way pd.read_csv does."""
+    counts = {}
+    result = []
+    for name in names:
+        count = counts.get(name, 0)
+        while count > 0:
+            counts[name] = count + 1
+            name = f"{name}.{count}"
+            count = counts.get(name, 0)
+        result.append(name)
+        counts[name] = count + 1
+    return result
+
+
+def drop_duplicate_rows(df):
+    """Keep the first of each set of identical rows, comparing one 64-bit hash per row."""
+    # hash_pandas_object turns objects into strings, which would make 1 and "1" collide, so text-like
+    # columns are hashed as codes that compare values the way drop_duplicates does
+    encoded = {}
+    for i, dtype in enumerate(df.dtypes):
+        col = df.iloc[:, i]
+        if isinstance(dtype, pd.CategoricalDtype):
+            encoded[i] = col.cat.codes.to_numpy()
+        elif dtype == object:
+            encoded[i] = pd.factorize(col)[0]
+        elif pd.api.types.is_float_dtype(dtype):
+            # Adding 0.0 turns -0.0 into 0.0, which pandas also treats as equal
+            encoded[i] = col.to_numpy() + 0.0
+        else:
+            encoded[i] = col.to_numpy()
+    row_hashes = pd.util.hash_pandas_object(pd.DataFrame(encoded, index=df.index), index=False).to_numpy()
+    _, first_rows = np.unique(row_hashes, return_index=True)
+    return df.iloc[np.sort(first_rows)]
+
+
+def read_csv_chunked(file, drop_duplicates=False, nrows=None):
+    """Read a CSV in chunks, dropping duplicate rows before the chunks are combined."""
+    parts = []
+    for chunk in pd.read_csv(file, chunksize=CSV_CHUNK_SIZE, nrows=nrows, engine="c"):
+        if drop_duplicates:
+            chunk = drop_duplicate_rows(chunk)
+        parts.append(chunk)
+    df = pd.concat(parts, ignore_index=True, copy=False)
+    del parts
+
+    # Duplicates can span chunks
+    if drop_duplicates:
+        df = drop_duplicate_rows(df).reset_index(drop=True)
+    return df
+
+
+def downcast_dtypes(df):
+    """Shrink numeric columns to the smallest dtype that holds them losslessly and encode repetitive text as categories."""
+    # Work by position so repeated column names (e.g. from Excel headers) cannot select several columns
+    for i, dtype in enumerate(df.dtypes):
+        col = df.iloc[:, i]
+        if pd.api.types.is_integer_dtype(dtype):
+            df.isetitem(i, pd.to_numeric(col, downcast="integer"))
+        elif pd.api.types.is_float_dtype(dtype):
+            # Only narrow complete floats that survive the round trip exactly; this tool must not alter
+            # values, and columns with gaps stay float64 so "Fill Missing Values" computes full-precision means
+            values = col.to_numpy()
+            if np.isnan(values).any():
+                continue
+            with np.errstate(over="ignore"):
+                narrowed = values.astype(np.float32)
+            if np.array_equal(narrowed.astype(values.dtype), values):
+                df.isetitem(i, narrowed)
+        elif dtype == object:
+            if col.nunique(dropna=True) / max(len(df), 1) < 0.5:
+                df.isetitem(i, col.astype("category"))
+    return df
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def load_file(file_bytes, file_name, drop_duplicates=False, nrows=None):
+    """Parse an uploaded CSV or Excel file into a DataFrame plus its numeric column names, cached across reruns."""
+    file_ext = os.path.splitext(file_name)[-1].lower()
+    buffer = BytesIO(file_bytes)
+    if file_ext == ".csv" and nrows is not None:
+        # The Arrow reader cannot stop early, so stream just the leading rows through pandas,
+        # dropping duplicates per chunk when that is requested so they never pile up
+        df = read_csv_chunked(buffer, drop_duplicates=drop_duplicates, nrows=nrows)
+    elif file_ext == ".csv":
+        # Arrow parses on multiple threads, then hands its buffers over to pandas
+        table = pacsv.read_csv(buffer, read_options=pacsv.ReadOptions(use_threads=True, block_size=8 << 20))
+        # Arrow keeps repeated header names as they are; pandas renames them, and the rest of the app relies on that
+        table = table.rename_columns(dedupe_column_names(table.column_names))
+        df = table.to_pandas(split_blocks=True, self_destruct=True)
+    elif file_ext == ".xlsx":
+        df = pd.read_excel(buffer, engine=EXCEL_READ_ENGINE)
+    else:
+        raise ValueError(f"Unsupported file type: {file_ext}")
+    df = downcast_dtypes(df)
+    return df, tuple(df.select_dtypes(include="number").columns)
+
+
+def clean_data_lazy(df, cleaning_options, columns_to_remove=()):
+    """Run the cleaning steps as one polars query so no intermediate frame is materialized."""
+    lf = pl.from_pandas(df).lazy()
+    if "Remove Duplicates" in cleaning_options:
+        lf = lf.unique(keep="first", maintain_order=True)
+    if "Remove Columns" in cleaning_options:
+        lf = lf.drop(list(columns_to_remove))
+    if "Fill Missing Values" in cleaning_options:
+        # Integer columns loaded through pandas cannot hold missing values, so only floats need filling
+        lf = lf.with_columns(cs.float().fill_null(strategy="mean"))
+    if "Standardize Column Names" in cleaning_options:
+        lf = lf.rename(standardize_column_name)
+    return lf.collect(engine="streaming").to_pandas()
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def clean_data(df, cleaning_options, columns_to_remove=()):
+    """Apply the selected cleaning options; cached on the data and the (hashable) option tuples."""
+    if not cleaning_options:
+        return df
+
+    # polars needs unique string column names; anything else takes the pandas path below
+    if pl is not None and df.columns.is_unique and all(isinstance(c, str) for c in df.columns):
+        try:
+            return clean_data_lazy(df, cleaning_options, columns_to_remove)
+        except (pa.ArrowInvalid, pa.ArrowTypeError, pl.exceptions.PolarsError):
+            # e.g. mixed-type object columns Arrow cannot convert, or names that collide once standardized
+            pass
+
+    if "Remove Duplicates" in cleaning_options:
+        df = drop_duplicate_rows(df)
+    # Columns are picked by their uploaded names, so drop them before any renaming
+    if "Remove Columns" in cleaning_options:
+        df = df.drop(columns=list(columns_to_remove))
+    if "Fill Missing Values" in cleaning_options:
+        # Filling in place with a per-column Series skips the subset copy and write-back
+        df.fillna(df.select_dtypes(include="number").mean(), inplace=True)
+    if "Standardize Column Names" in cleaning_options:
+        df.columns = [standardize_column_name(c) for c in df.columns]
+    return df
+
+
+def is_plain_csv_type(arrow_type):
+    """True for Arrow types whose CSV text matches pandas': integers and (dictionary-encoded) strings."""
+    if pa.types.is_dictionary(arrow_type):
+        arrow_type = arrow_type.value_type
+    return pa.types.is_integer(arrow_type) or pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type)
+
+
+def to_csv_bytes(df):
+    """Serialize a DataFrame to CSV bytes for download, preferring Arrow's multithreaded writer."""
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        # Arrow spells floats, booleans and dates differently from pandas, so those frames keep the pandas writer
+        if all(is_plain_csv_type(field.type) for field in table.schema):
+            sink = pa.BufferOutputStream()
+            # pandas writes the header so it is quoted exactly as before. Arrow leaves values unquoted and
+            # raises ArrowInvalid on any value that would need quotes, which sends the frame to pandas below
+            sink.write(df.iloc[:0].to_csv(index=False, lineterminator="\n").encode("utf-8"))
+            write_options = pacsv.WriteOptions(include_header=False, quoting_style="none")
+            pacsv.write_csv(table, sink, write_options=write_options)
+            return sink.getvalue().to_pybytes()
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError, ValueError):
+        # Frames Arrow cannot represent or write (e.g. mixed-type objects, duplicate column names) go through pandas
+        pass
+    return df.to_csv(index=False, lineterminator="\n", chunksize=100_000).encode("utf-8")
+
+
+def to_xlsx_bytes(df):
+    """Serialize a DataFrame to xlsx bytes for download."""
+    buffer = BytesIO()
+    engine_kwargs = XLSX_WRITER_OPTIONS if EXCEL_WRITE_ENGINE == "xlsxwriter" else None
+    with pd.ExcelWriter(buffer, engine=EXCEL_WRITE_ENGINE, engine_kwargs=engine_kwargs) as writer:
+        df.to_excel(writer, index=False)
+    return buffer.getvalue()
+
+
+def binned_means(df, x_axis, y_axis, bins=CHART_BINS):
+    """Mean of the Y column within equal-width bins of the X column, indexed by bin midpoint.
+
+    Rows with a missing or infinite value are left out; the result is empty when none remain.
+    """
+    x = df[x_axis].to_numpy(dtype=np.float64)
+    y = df[y_axis].to_numpy(dtype=np.float64)
+    finite = np.isfinite(x) & np.isfinite(y)
+    if not finite.any():
+        return pd.Series(dtype=np.float64, name=y_axis)
+    binned = pd.cut(x[finite], bins=bins)
+    means = pd.Series(y[finite], name=y_axis).groupby(binned, observed=True).mean()
+    means.index = pd.IntervalIndex(means.index).mid
+    return means
+
+
+def histogram(values, bins=HISTOGRAM_BINS):
+    """Counts of the finite values in equal-width bins, indexed by bin midpoint; empty when there are none."""
+    finite = values.to_numpy(dtype=np.float64)
+    finite = finite[np.isfinite(finite)]
+    if len(finite) == 0:
+        return pd.Series(dtype=np.int64, name=values.name)
+    counts, edges = np.histogram(finite, bins=bins)
+    return pd.Series(counts, index=(edges[:-1] + edges[1:]) / 2, name=values.name)
+
+
+if njit is not None:
+    @njit(parallel=True, fastmath={"reassoc", "contract"}, error_model="numpy", cache=True)
+    def pearson_corr(X):
+        """Pearson correlation matrix of the columns of a dense float64 array without NaNs."""
+        n, k = X.shape
+        Xc = np.empty_like(X)
+        norms = np.empty(k)
+        for j in prange(k):
+            Xc[:, j] = X[:, j] - X[:, j].sum() / n
+            norms[j] = np.sqrt((Xc[:, j] * Xc[:, j]).sum())
+        corr = np.empty((k, k))
+        for i in prange(k):
+            for j in range(i, k):
+                total = 0.0
+                for r in range(n):
+                    total += Xc[r, i] * Xc[r, j]
+                corr[i, j] = total / (norms[i] * norms[j])
+                corr[j, i] = corr[i, j]
+        return corr
+else:
+    pearson_corr = None
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def cached_correlation(data_bytes, columns, n_rows):
+    """Correlate a row-major float64 buffer; cached on its bytes so unrelated reruns skip the recompute."""
+    columns = list(columns)
+    values = np.frombuffer(data_bytes, dtype=np.float64).reshape(n_rows, len(columns))
+    if pearson_corr is None or n_rows < 2 or np.isnan(values).any():
+        # pandas handles missing values pairwise, which the kernel does not
+        return pd.DataFrame(values, columns=columns).corr()
+    return pd.DataFrame(pearson_corr(np.asfortranarray(values)), index=columns, columns=columns)
+
+
+def correlation_matrix(df, numeric_cols):
+    """Correlate the numeric columns, using the compiled kernel when the data allows it."""
+    values = df[numeric_cols].to_numpy(dtype=np.float64)
+    return cached_correlation(values.tobytes(), tuple(numeric_cols), len(values))
+
+
 # Set up the App
 st.set_page_config(page_title="🧹 Data Sweeper", layout="wide", page_icon="🧹")
 st.title("🧹Advanced Data Sweeper")
@@ -43,6 +357,7 @@ st.sidebar.write("Customize your data cleaning and conversion experience.")
 
 # Data Cleaning Options
 st.sidebar.subheader("Data Cleaning Options")
+st.sidebar.caption("Applied to every uploaded file, together with the options chosen for each file.")
 remove_duplicates = st.sidebar.checkbox("Remove Duplicates")
 fill_missing_values = st.sidebar.checkbox("Fill Missing Values")
 standardize_columns = st.sidebar.checkbox("Standardize Column Names")
@@ -57,13 +372,11 @@ conversion_type = st.sidebar.radio(
 if st.sidebar.button("Convert and Download"):
     if 'df' in st.session_state:
         df = st.session_state.df
-        buffer = BytesIO()
+        # Passing a callable defers serialization until the download is actually requested
         if conversion_type == "CSV":
-            df.to_csv(buffer, index=False)
-            st.download_button("Download CSV", data=buffer.getvalue(), file_name="converted_file.csv", mime="text/csv")
+            st.download_button("Download CSV", data=partial(to_csv_bytes, df), file_name="converted_file.csv", mime="text/csv")
         else:
-            df.to_excel(buffer, index=False)
-            st.download_button("Download Excel", data=buffer.getvalue(), file_name="converted_file.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+            st.download_button("Download Excel", data=partial(to_xlsx_bytes, df), file_name="converted_file.xlsx", mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
     else:
         st.warning("No data loaded to convert.")
 
@@ -81,142 +394,221 @@ if "cleaned_data" not in st.session_state:
 if "show_balloons" not in st.session_state:
     st.session_state.show_balloons = False
 
+# Sidebar cleaning options apply to every file on top of its own selection
+global_options = [
+    option for option, enabled in zip(
+        CLEANING_OPTIONS, [remove_duplicates, fill_missing_values, standardize_columns, remove_columns]
+    )
+    if enabled
+]
+
 # Process each uploaded file
 if uploaded_files:
-    for file in uploaded_files:
-        st.divider()
-        st.subheader(f"📄 File: {file.name}")
+    # Parse all uploads in parallel; the Arrow and calamine readers release the GIL while parsing
+    supported_files = [f for f in uploaded_files if os.path.splitext(f.name)[-1].lower() in (".csv", ".xlsx")]
 
-        # Load the file into a DataFrame
-        try:
+    # Files over the memory budget are only read in part (CSV) or not at all (Excel)
+    budget = memory_budget()
+    row_limits = {}
+    for file in supported_files:
+        if file.size > budget and file.name.lower().endswith(".csv"):
+            row_limits[file.file_id] = st.sidebar.slider(
+                f"Rows to read from {file.name}",
+                10_000, 5_000_000, 500_000, step=10_000,
+                key=f"nrows_{file.name}"
+            )
+    loadable_files = [f for f in supported_files if f.size <= budget or f.file_id in row_limits]
+
+    loads = {}
+    if loadable_files:
+        progress = st.progress(0.0, text="Loading files...")
+        with ThreadPoolExecutor(max_workers=min(MAX_LOAD_WORKERS, len(loadable_files))) as executor:
+            loads = {
+                file.file_id: executor.submit(
+                    # Deduplicating while reading only applies to partial reads; keeping it out of the
+                    # cache key otherwise means toggling the sidebar checkbox does not re-parse every file
+                    load_file, file.getvalue(), file.name,
+                    remove_duplicates and file.file_id in row_limits, row_limits.get(file.file_id)
+                )
+                for file in loadable_files
+            }
+            for done, _ in enumerate(as_completed(loads.values()), start=1):
+                progress.progress(done / len(loads), text=f"Loaded {done} of {len(loads)} files")
+        progress.empty()
+
+    # One tab per file; tab contents always run, but the cached load and cleaning keep revisits cheap
+    st.divider()
+    tabs = st.tabs([f"📄 {f.name}" for f in uploaded_files])
+    for file, tab in zip(uploaded_files, tabs):
+        with tab:
+            st.subheader(f"📄 File: {file.name}")
+
+            # Load the file into a DataFrame
             file_ext = os.path.splitext(file.name)[-1].lower()
-            if file_ext == ".csv":
-                df = pd.read_csv(file)
-            elif file_ext == ".xlsx":
-                df = pd.read_excel(file)
-            else:
+            if file_ext not in (".csv", ".xlsx"):
                 st.error(f"Unsupported file type: {file_ext}")
                 continue
-        except Exception as e:
-            st.error(f"Error loading file: {e}")
-            continue
-
-        # Display file info
-        st.write(f"**File Size:** {file.size / 1024:.2f} KB")
-        st.write(f"**Total Rows:** {len(df)}")
-        st.write(f"**Total Columns:** {len(df.columns)}")
-
-        # Show a preview of the data
-        with st.expander("👀 Preview Data"):
-            st.dataframe(df.head())
-
-        # Data Cleaning Options
-        st.subheader("🧹 Data Cleaning Options")
-        cleaning_options = st.multiselect(
-            f"Select cleaning options for {file.name}:",
-            ["Remove Duplicates", "Fill Missing Values", "Standardize Column Names", "Remove Columns"],
-            key=f"cleaning_{file.name}"
-        )
-
-        # Apply cleaning options
-        if "Remove Duplicates" in cleaning_options:
-            df = df.drop_duplicates()
-            st.success("✅ Duplicates removed!")
-        if "Fill Missing Values" in cleaning_options:
-            numeric_cols = df.select_dtypes(include=["number"]).columns
-            df[numeric_cols] = df[numeric_cols].fillna(df[numeric_cols].mean())
-            st.success("✅ Missing values filled!")
-        if "Standardize Column Names" in cleaning_options:
-            df.columns = df.columns.str.lower().str.replace(" ", "_")
-            st.success("✅ Column names standardized!")
-        if "Remove Columns" in cleaning_options:
-            columns_to_remove = st.multiselect(
-                f"Select columns to remove for {file.name}:",
+            if file.file_id not in loads:
+                st.error(
+                    f"{file.name} is {file.size / 1024**2:.0f} MB, more than the {budget / 1024**2:.0f} MB "
+                    "that can be loaded safely. Excel files cannot be read in part; please split it or save it as CSV."
+                )
+                continue
+            if file.file_id in row_limits:
+                st.warning(
+                    f"{file.name} is larger than the {budget / 1024**2:.0f} MB memory budget, so only its first "
+                    f"{row_limits[file.file_id]:,} rows were read. Adjust the limit in the sidebar."
+                )
+            try:
+                df, numeric_cols = loads[file.file_id].result()
+            except Exception as e:
+                st.error(f"Error loading file: {e}")
+                continue
+
+            # Display file info
+            st.write(f"**File Size:** {file.size / 1024:.2f} KB")
+            st.write(f"**Total Rows:** {len(df)}")
+            st.write(f"**Total Columns:** {len(df.columns)}")
+
+            # Show a preview of the data
+            with st.expander("👀 Preview Data"):
+                st.dataframe(df.head())
+
+            # Data Cleaning Options
+            st.subheader("🧹 Data Cleaning Options")
+            # Widgets inside a form only rerun the script once the user applies them
+            with st.form(f"clean_form_{file.name}"):
+                file_options = st.multiselect(
+                    f"Select cleaning options for {file.name}:",
+                    CLEANING_OPTIONS,
+                    key=f"cleaning_{file.name}"
+                )
+                columns_to_remove = st.multiselect(
+                    f"Select columns to remove for {file.name}:",
+                    df.columns,
+                    key=f"remove_{file.name}",
+                    help='Used when "Remove Columns" is selected here or in the sidebar.'
+                )
+                st.form_submit_button("Apply cleaning")
+            cleaning_options = [o for o in CLEANING_OPTIONS if o in file_options or o in global_options]
+
+            # Apply cleaning options
+            df = clean_data(df, tuple(cleaning_options), tuple(columns_to_remove))
+            if "Remove Duplicates" in cleaning_options:
+                st.success("✅ Duplicates removed!")
+            if "Fill Missing Values" in cleaning_options:
+                st.success("✅ Missing values filled!")
+            if "Standardize Column Names" in cleaning_options:
+                st.success("✅ Column names standardized!")
+            if "Remove Columns" in cleaning_options:
+                st.success("✅ Columns removed!")
+
+            # Cleaning never changes a column's dtype, so carry the numeric columns over by name
+            if "Remove Columns" in cleaning_options:
+                numeric_cols = tuple(c for c in numeric_cols if c not in columns_to_remove)
+            if "Standardize Column Names" in cleaning_options:
+                numeric_cols = tuple(standardize_column_name(c) for c in numeric_cols)
+
+            # Save cleaned data to session state
+            st.session_state.cleaned_data[file.name] = df
+
+            # Select Columns to Keep
+            st.subheader("🔍 Select Columns to Keep")
+            columns_to_keep = st.multiselect(
+                f"Choose columns to keep for {file.name}:",
                 df.columns,
-                key=f"remove_{file.name}"
+                default=df.columns,
+                key=f"columns_{file.name}"
             )
-            df = df.drop(columns=columns_to_remove)
-            st.success("✅ Columns removed!")
-
-        # Save cleaned data to session state
-        st.session_state.cleaned_data[file.name] = df
-
-        # Select Columns to Keep
-        st.subheader("🔍 Select Columns to Keep")
-        columns_to_keep = st.multiselect(
-            f"Choose columns to keep for {file.name}:",
-            df.columns,
-            default=df.columns,
-            key=f"columns_{file.name}"
-        )
-        df = df[columns_to_keep]
-
-        # Data Visualization
-        st.subheader("📊 Data Visualization")
-        if st.checkbox(f"Show visualizations for {file.name}", key=f"viz_{file.name}"):
-            numeric_cols = df.select_dtypes(include=["number"]).columns
-            if len(numeric_cols) > 0:
-                chart_type = st.selectbox(
-                    f"Select chart type for {file.name}:",
-                    ["Bar Chart", "Line Chart", "Histogram", "Scatter Plot", "Box Plot", "Correlation Matrix"],
-                    key=f"chart_{file.name}"
-                )
-                if chart_type in ["Bar Chart", "Line Chart", "Histogram", "Scatter Plot", "Box Plot"]:
-                    x_axis = st.selectbox("Select X-axis:", numeric_cols, key=f"x_{file.name}")
-                    y_axis = st.selectbox("Select Y-axis:", numeric_cols, key=f"y_{file.name}")
-
-                    if chart_type == "Bar Chart":
-                        st.bar_chart(df[[x_axis, y_axis]])
-                    elif chart_type == "Line Chart":
-                        st.line_chart(df[[x_axis, y_axis]])
-                    elif chart_type == "Histogram":
-                        st.bar_chart(df[x_axis])
-                    elif chart_type == "Scatter Plot":
-                        fig, ax = plt.subplots()
-                        sns.scatterplot(data=df, x=x_axis, y=y_axis, ax=ax)
-                        st.pyplot(fig)
-                    elif chart_type == "Box Plot":
+            df = df[columns_to_keep]
+            kept = set(columns_to_keep)
+            numeric_cols = [c for c in numeric_cols if c in kept]
+
+            # Data Visualization
+            st.subheader("📊 Data Visualization")
+            if st.checkbox(f"Show visualizations for {file.name}", key=f"viz_{file.name}"):
+                if len(numeric_cols) > 0:
+                    chart_type = st.selectbox(
+                        f"Select chart type for {file.name}:",
+                        ["Bar Chart", "Line Chart", "Histogram", "Scatter Plot", "Box Plot", "Correlation Matrix"],
+                        key=f"chart_{file.name}"
+                    )
+                    if chart_type in ["Bar Chart", "Line Chart", "Histogram", "Scatter Plot", "Box Plot"]:
+                        x_axis = st.selectbox("Select X-axis:", numeric_cols, key=f"x_{file.name}")
+                        y_axis = st.selectbox("Select Y-axis:", numeric_cols, key=f"y_{file.name}")
+
+                        # Summarize into bins rather than charting every row
+                        if chart_type in ["Bar Chart", "Line Chart", "Histogram"]:
+                            if chart_type == "Histogram":
+                                summary = histogram(df[x_axis])
+                            else:
+                                summary = binned_means(df, x_axis, y_axis)
+                            if summary.empty:
+                                st.warning("No finite values to chart for the selected columns.")
+                            elif chart_type == "Line Chart":
+                                st.line_chart(summary)
+                            else:
+                                st.bar_chart(summary)
+                        elif chart_type == "Scatter Plot":
+                            # Every point is its own marker, so sample large frames down first
+                            plot_df = df if len(df) <= MAX_PLOT_POINTS else df.sample(MAX_PLOT_POINTS, random_state=0)
+                            fig, ax = plt.subplots()
+                            sns.scatterplot(data=plot_df, x=x_axis, y=y_axis, ax=ax)
+                            st.pyplot(fig)
+                            if len(plot_df) < len(df):
+                                st.caption(f"Subsampled to {MAX_PLOT_POINTS:,} points for responsiveness")
+                        elif chart_type == "Box Plot":
+                            # A numeric X-axis would give one box per distinct value, so summarize Y alone
+                            fig, ax = plt.subplots()
+                            sns.boxplot(y=df[y_axis], ax=ax)
+                            st.pyplot(fig)
+                    elif chart_type == "Correlation Matrix":
+                        corr = correlation_matrix(df, numeric_cols)
                         fig, ax = plt.subplots()
-                        sns.boxplot(data=df, x=x_axis, y=y_axis, ax=ax)
+                        image = ax.imshow(corr.to_numpy(), cmap="coolwarm", vmin=-1, vmax=1)
+                        fig.colorbar(image, ax=ax)
+                        ax.set_xticks(range(len(corr)))
+                        ax.set_xticklabels(corr.columns, rotation=90)
+                        ax.set_yticks(range(len(corr)))
+                        ax.set_yticklabels(corr.columns)
+                        # One text artist per cell gets expensive fast, so only annotate small matrices
+                        if len(corr) <= MAX_ANNOTATED_CORR_COLUMNS:
+                            for i in range(len(corr)):
+                                for j in range(len(corr)):
+                                    ax.text(j, i, f"{corr.iat[i, j]:.2f}", ha="center", va="center", fontsize=7)
                         st.pyplot(fig)
-                elif chart_type == "Correlation Matrix":
-                    corr = df.corr()
-                    fig, ax = plt.subplots()
-                    sns.heatmap(corr, annot=True, ax=ax)
-                    st.pyplot(fig)
-            else:
-                st.warning("No numeric columns found for visualization.")
-
-        # File Conversion
-        st.subheader("🛠️ File Conversion")
-        conversion_type = st.radio(
-            f"Convert {file.name} to:",
-            ["CSV", "Excel"],
-            key=f"convert_{file.name}"
-        )
-
-        if st.button(f"Convert {file.name}", key=f"convert_btn_{file.name}"):
-            buffer = BytesIO()
-            if conversion_type == "CSV":
-                df.to_csv(buffer, index=False)
-                file_name = file.name.replace(file_ext, ".csv")
-                mime_type = "text/csv"
-            elif conversion_type == "Excel":
-                df.to_excel(buffer, index=False)
-                file_name = file.name.replace(file_ext, ".xlsx")
-                mime_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            buffer.seek(0)
-
-            # Download Button
-            st.download_button(
-                label=f"📥 Download {file.name} as {conversion_type}",
-                data=buffer,
-                file_name=file_name,
-                mime=mime_type,
-                key=f"download_{file.name}"
+                else:
+                    st.warning("No numeric columns found for visualization.")
+
+            # File Conversion
+            st.subheader("🛠️ File Conversion")
+            conversion_type = st.radio(
+                f"Convert {file.name} to:",
+                ["CSV", "Excel"],
+                key=f"convert_{file.name}"
             )
-            st.success(f"🎉 {file.name} converted to {conversion_type}!")
-            st.session_state.show_balloons = True  # Set balloons trigger to True
+
+            if st.button(f"Convert {file.name}", key=f"convert_btn_{file.name}"):
+                # Serialization is deferred until the download is actually requested
+                if conversion_type == "CSV":
+                    data = partial(to_csv_bytes, df)
+                    file_name = file.name.replace(file_ext, ".csv")
+                    mime_type = "text/csv"
+                elif conversion_type == "Excel":
+                    data = partial(to_xlsx_bytes, df)
+                    file_name = file.name.replace(file_ext, ".xlsx")
+                    mime_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+                # Download Button
+                st.download_button(
+                    label=f"📥 Download {file.name} as {conversion_type}",
+                    data=data,
+                    file_name=file_name,
+                    mime=mime_type,
+                    key=f"download_{file.name}"
+                )
+                st.success(f"🎉 {file.name} converted to {conversion_type}!")
+                st.session_state.show_balloons = True  # Set balloons trigger to True
 
     # Show balloons only once after all files are processed
     if st.session_state.show_balloons: